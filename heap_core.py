@@ -0,0 +1,920 @@
+"""
+heap_core.py
+Shared storage layer for the labs: heap-file pages plus binary records
+described by a JSON table schema. tp2.py and alltp.py import from here.
+
+Provides:
+- encode_record(record_dict, table_name, schema) -> bytes
+- decode_record(record_bytes, table_name, schema) -> dict
+- insert_structured_record(table_name, schema, record_dict) -> (page, slot)
+- encode_records(record_dicts, table_name, schema) -> bytearray
+- insert_structured_records(table_name, schema, record_dicts) -> [(page, slot)]
+- read_all_structured_records(table_name, schema, predicate=None) -> [dict]
+- iter_structured_records(table_name, schema, predicate=None) -> iterator of dict
+- read_all_columnar(table_name, schema, copy=True) -> {field: column}
+- columnar_cached(table_name, schema) -> bool  (read_all_columnar would not rescan)
+- read_column(table_name, schema, field) -> column  (tables with "storage": "columnar")
+- read_columns(table_name, schema, fields) -> {field: column}  (same)
+- flush_all() -> None  (write cached dirty pages back to disk)
+
+Heap file layout:
+- PAGE_SIZE = 4096
+- Footer (last 4 bytes): [2 bytes slot_count][2 bytes free_space_offset] (big-endian)
+- Slot entry: 4 bytes: [2 bytes offset][2 bytes length], stable per slot index:
+    slot_i_pos = PAGE_SIZE - FOOTER_SIZE - (i+1) * SLOT_ENTRY_SIZE
+- Records packed from start of page upward.
+
+Columnar sidecars (opt-in with "storage": "columnar" on a table):
+- one file per field next to the heap file: <table>.<field>.col
+- each holds that field's encoded values back to back, in insert order
+- <table>.colstamp records the heap file's mtime, size and record format
+  as of the last read that found the sidecars in step with it
+"""
+
+import os
+import json
+import atexit
+import mmap
+import struct
+import sys
+from array import array
+from collections import OrderedDict, namedtuple
+from functools import lru_cache
+from itertools import compress, repeat, tee
+from operator import eq, itemgetter
+from typing import Dict, Any, Iterator, List, Optional, Set, Tuple
+
+# --------------------------------
+# Constants
+# --------------------------------
+PAGE_SIZE = 4096
+FOOTER_SIZE = 4
+SLOT_ENTRY_SIZE = 4
+UINT16_FMT = ">H"
+FOOTER_FMT = ">HH"
+SLOT_FMT = ">HH"
+INT32_FMT = ">i"
+FLOAT32_FMT = ">f"
+
+# Precompiled footer / slot-entry codecs: both are two big-endian uint16
+_FOOTER = struct.Struct(FOOTER_FMT)
+_SLOT = struct.Struct(SLOT_FMT)
+
+# --------------------------------
+# Primitive pack/unpack helpers
+# --------------------------------
+# ints and floats (and CHAR encoding) are handled by the compiled table
+# layout; only the string decoders are needed on their own, for columns
+def _unpack_char(b: bytes) -> str:
+    return b.rstrip(b'\x00').decode("utf-8")
+
+def _pack_varchar(s: str, n: int) -> bytes:
+    b = s.encode("utf-8")[:min(n, 255)]
+    # store 1-byte length then content and pad up to n bytes (so total stored = 1 + n)
+    return bytes((len(b),)) + b.ljust(n, b'\x00')
+
+def _unpack_varchar(b: bytes, n: int) -> str:
+    if len(b) == 0:
+        return ""
+    length = b[0]
+    data = b[1:1+length]
+    return data.decode("utf-8")
+
+# --------------------------------
+# Heap page helpers
+# --------------------------------
+def _read_footer(page: bytes) -> Tuple[int, int]:
+    if len(page) != PAGE_SIZE:
+        raise ValueError("page must be PAGE_SIZE bytes")
+    return _FOOTER.unpack_from(page, PAGE_SIZE - FOOTER_SIZE)
+
+def _read_footer_fast(page: bytes) -> Tuple[int, int]:
+    # no length check: only for pages this module already read or built
+    return _FOOTER.unpack_from(page, PAGE_SIZE - FOOTER_SIZE)
+
+def _free_space(slot_count: int, free_offset: int) -> int:
+    return PAGE_SIZE - FOOTER_SIZE - slot_count * SLOT_ENTRY_SIZE - free_offset
+
+def _write_footer(page: bytearray, slot_count: int, free_offset: int) -> None:
+    _FOOTER.pack_into(page, PAGE_SIZE - FOOTER_SIZE, slot_count, free_offset)
+
+def _slot_pos(slot_index: int) -> int:
+    # stable position for slot i (0-based)
+    return PAGE_SIZE - FOOTER_SIZE - (slot_index + 1) * SLOT_ENTRY_SIZE
+
+def _read_slot(page: bytes, slot_index: int, slot_count: int) -> Tuple[int, int]:
+    if slot_index < 0 or slot_index >= slot_count:
+        raise IndexError("slot_index out of range")
+    return _SLOT.unpack_from(page, _slot_pos(slot_index))
+
+def _write_slot(page: bytearray, slot_index: int, offset: int, length: int) -> None:
+    _SLOT.pack_into(page, _slot_pos(slot_index), offset, length)
+
+def initialize_empty_page() -> bytes:
+    p = bytearray(PAGE_SIZE)
+    _write_footer(p, 0, 0)
+    return bytes(p)
+
+def free_space_in_page(page: bytes) -> int:
+    return _free_space(*_read_footer(page))
+
+def insert_record_into_page(page: bytearray, record: bytes) -> int:
+    # mutates page in place and returns the new slot index
+    slot_count, free_offset = _read_footer(page)
+    needed = len(record) + SLOT_ENTRY_SIZE
+    if _free_space(slot_count, free_offset) < needed:
+        raise ValueError("Not enough space in page")
+    page[free_offset:free_offset+len(record)] = record
+    _write_slot(page, slot_count, free_offset, len(record))
+    _write_footer(page, slot_count + 1, free_offset + len(record))
+    return slot_count
+
+def get_record_from_page(page: bytes, slot_index: int, slot_count: Optional[int] = None) -> bytes:
+    # scan loops that already hold the footer pass slot_count to skip re-reading it
+    if slot_count is None:
+        slot_count, _ = _read_footer(page)
+    offset, length = _read_slot(page, slot_index, slot_count)
+    return page[offset:offset+length]
+
+# --------------------------------
+# File-level heap functions
+# --------------------------------
+# Open descriptors for the most recently used heap files, in LRU order:
+# {fname: (fd, writable, (st_dev, st_ino))}. Page I/O goes through
+# positional pread/pwrite, so no seek is needed per page.
+_FD_CACHE_SIZE = 16
+_FD_CACHE: "OrderedDict[str, Tuple[int, bool, Tuple[int, int]]]" = OrderedDict()
+
+if hasattr(os, "pread"):
+    _pread, _pwrite = os.pread, os.pwrite
+else:
+    # no positional I/O on this platform (Windows): seek on the cached fd
+    def _pread(fd: int, n: int, offset: int) -> bytes:
+        os.lseek(fd, offset, os.SEEK_SET)
+        return os.read(fd, n)
+
+    def _pwrite(fd: int, data: bytes, offset: int) -> int:
+        os.lseek(fd, offset, os.SEEK_SET)
+        return os.write(fd, data)
+
+def _get_fd(fname: str, write: bool = False) -> int:
+    cached = _FD_CACHE.get(fname)
+    if cached is not None:
+        # the path may have been removed or replaced since it was opened
+        try:
+            st = os.stat(fname)
+            same = (st.st_dev, st.st_ino) == cached[2]
+        except FileNotFoundError:
+            same = False
+        if same and (cached[1] or not write):
+            _FD_CACHE.move_to_end(fname)
+            return cached[0]
+        _close_fd(fname)
+    flags = (os.O_RDWR if write else os.O_RDONLY) | getattr(os, "O_BINARY", 0)
+    fd = os.open(fname, flags)
+    st = os.fstat(fd)
+    _FD_CACHE[fname] = (fd, write, (st.st_dev, st.st_ino))
+    while len(_FD_CACHE) > _FD_CACHE_SIZE:
+        _, old = _FD_CACHE.popitem(last=False)
+        os.close(old[0])
+    return fd
+
+def _close_fd(fname: str) -> None:
+    cached = _FD_CACHE.pop(fname, None)
+    if cached is not None:
+        os.close(cached[0])
+
+@atexit.register
+def _close_all_fds() -> None:
+    for fname in list(_FD_CACHE):
+        _close_fd(fname)
+
+def create_heap_file(fname: str) -> None:
+    # the path may now name a different inode than a cached descriptor
+    _evict_file(fname, write_back=False)
+    _close_fd(fname)
+    with open(fname, "wb") as f:
+        f.write(initialize_empty_page())
+    _FSM.pop(fname, None)
+
+def read_page(fname: str, page_num: int) -> bytes:
+    cached = _PAGE_CACHE.get((fname, page_num))
+    if cached is not None:
+        return bytes(cached)
+    data = _pread(_get_fd(fname), PAGE_SIZE, page_num * PAGE_SIZE)
+    if len(data) != PAGE_SIZE:
+        raise IOError("Failed to read full page")
+    return data
+
+def write_page(fname: str, page_num: int, page_data: bytes) -> None:
+    if len(page_data) != PAGE_SIZE:
+        raise ValueError("page_data must be PAGE_SIZE bytes")
+    _changed(fname)
+    _store_page(fname, page_num, page_data)
+
+def _store_page(fname: str, page_num: int, page_data: bytes) -> None:
+    # write one page through, keeping a cached copy and the map in step;
+    # write-back of a dirty page goes straight here, as its change was
+    # already counted when the page was dirtied
+    key = (fname, page_num)
+    cached = _PAGE_CACHE.get(key)
+    if cached is not None and cached is not page_data:
+        cached[:] = page_data
+    _DIRTY.discard(key)
+    _pwrite(_get_fd(fname, write=True), page_data, page_num * PAGE_SIZE)
+    _fsm_update(fname, page_num, page_data)
+
+def append_page(fname: str, page_data: bytes) -> None:
+    if len(page_data) != PAGE_SIZE:
+        raise ValueError("page_data must be PAGE_SIZE bytes")
+    _flush_file(fname)
+    _changed(fname)
+    fd = _get_fd(fname, write=True)
+    size = os.fstat(fd).st_size
+    _pwrite(fd, page_data, size)
+    _fsm_update(fname, size // PAGE_SIZE, page_data)
+
+# Write-back page cache: {(fname, page_num): bytearray} in LRU order. Inserts
+# mutate cached pages in place and only mark them dirty; dirty pages reach
+# disk on eviction, before any scan of their file, or via flush_all().
+_PAGE_CACHE_SIZE = 128
+_PAGE_CACHE: "OrderedDict[Tuple[str, int], bytearray]" = OrderedDict()
+_DIRTY: Set[Tuple[str, int]] = set()
+
+# Decoded columns kept by read_all_columnar: {fname: (mtime_ns, size, layout,
+# columns)} in LRU order, for heap files totalling at most _COLUMN_CACHE_BYTES
+# on disk (a larger table is decoded per call and not kept). Every write path
+# here drops the file's entry; mtime and size catch writes made by other
+# processes.
+_COLUMN_CACHE_BYTES = 2 << 20
+_COLUMN_CACHE: "OrderedDict[str, Tuple[int, int, Any, Dict[str,Any]]]" = OrderedDict()
+
+# Writes made through this module to each heap file, counted so columnar
+# sidecars can tell whether they were kept in step with the heap
+_HEAP_GEN: Dict[str, int] = {}
+
+def _changed(fname: str) -> None:
+    # every write path calls this before touching the heap file
+    _COLUMN_CACHE.pop(fname, None)
+    _HEAP_GEN[fname] = _HEAP_GEN.get(fname, 0) + 1
+
+def _get_page(fname: str, page_num: int) -> bytearray:
+    key = (fname, page_num)
+    page = _PAGE_CACHE.get(key)
+    if page is None:
+        page = bytearray(read_page(fname, page_num))
+        _put_page(fname, page_num, page, dirty=False)
+    else:
+        _PAGE_CACHE.move_to_end(key)
+    return page
+
+def _put_page(fname: str, page_num: int, page: bytearray, dirty: bool = True) -> None:
+    key = (fname, page_num)
+    _PAGE_CACHE[key] = page
+    _PAGE_CACHE.move_to_end(key)
+    if dirty:
+        _DIRTY.add(key)
+        _changed(fname)
+    while len(_PAGE_CACHE) > _PAGE_CACHE_SIZE:
+        old_key, old_page = _PAGE_CACHE.popitem(last=False)
+        if old_key in _DIRTY:
+            _write_back(old_key[0], old_key[1], old_page)
+
+def _write_back(fname: str, page_num: int, page: bytearray) -> None:
+    if os.path.exists(fname):
+        _store_page(fname, page_num, page)
+        return
+    # the file was removed behind the cache (os.remove): its dirty pages have
+    # nowhere to go, so drop everything still cached for it
+    _DIRTY.discard((fname, page_num))
+    _evict_file(fname, write_back=False)
+    _close_fd(fname)
+    _FSM.pop(fname, None)
+
+def _flush_file(fname: str) -> None:
+    for key in sorted(k for k in _DIRTY if k[0] == fname):
+        if key in _DIRTY:
+            _write_back(fname, key[1], _PAGE_CACHE[key])
+
+def _evict_file(fname: str, write_back: bool = True) -> None:
+    # callers are about to rewrite the file outside the page cache
+    _changed(fname)
+    if write_back:
+        _flush_file(fname)
+    for key in [k for k in _PAGE_CACHE if k[0] == fname]:
+        del _PAGE_CACHE[key]
+        _DIRTY.discard(key)
+
+@atexit.register
+def flush_all() -> None:
+    for key in sorted(_DIRTY):
+        if key in _DIRTY:
+            _write_back(key[0], key[1], _PAGE_CACHE[key])
+
+# In-process free-space map: {fname: [free bytes per page]}, built on the
+# first insert into a file and kept current by every insert path and by
+# write_page/append_page.
+_FSM: Dict[str, List[int]] = {}
+
+def _free_space_map(fname: str) -> List[int]:
+    fsm = _FSM.get(fname)
+    if fsm is None:
+        _flush_file(fname)
+        mm, num_pages = _mmap_file(fname)
+        try:
+            fsm = [_free_space(*_FOOTER.unpack_from(mm, (p + 1) * PAGE_SIZE - FOOTER_SIZE)) for p in range(num_pages)]
+        finally:
+            mm.close()
+        _FSM[fname] = fsm
+    return fsm
+
+def _fsm_update(fname: str, page_num: int, page: bytes) -> None:
+    fsm = _FSM.get(fname)
+    if fsm is None:
+        return
+    free = _free_space(*_read_footer_fast(page))
+    if page_num < len(fsm):
+        fsm[page_num] = free
+    elif page_num == len(fsm):
+        fsm.append(free)
+    else:
+        # a page written past the mapped end: rebuild from disk when next needed
+        del _FSM[fname]
+
+def _end_page(fname: str) -> int:
+    # number of pages including cached pages not yet flushed past EOF
+    end = os.fstat(_get_fd(fname)).st_size // PAGE_SIZE
+    for name, page_num in _PAGE_CACHE:
+        if name == fname and page_num >= end:
+            end = page_num + 1
+    return end
+
+def insert_record(fname: str, record: bytes) -> Tuple[int,int]:
+    if not os.path.exists(fname) or os.path.getsize(fname) == 0:
+        create_heap_file(fname)
+    fsm = _free_space_map(fname)
+    needed = len(record) + SLOT_ENTRY_SIZE
+    for p, free in enumerate(fsm):
+        if free >= needed:
+            page = _get_page(fname, p)
+            try:
+                slot = insert_record_into_page(page, record)
+            except ValueError:
+                # stale map entry: correct it and try the next page
+                fsm[p] = _free_space(*_read_footer_fast(page))
+                continue
+            _DIRTY.add((fname, p))
+            _changed(fname)
+            fsm[p] = free - needed
+            return p, slot
+    # append new page (reaches the file when it is flushed); it must go at
+    # the real end, so a map shorter than the file is rebuilt first
+    if len(fsm) < _end_page(fname):
+        _FSM.pop(fname, None)
+        return insert_record(fname, record)
+    page = bytearray(initialize_empty_page())
+    slot = insert_record_into_page(page, record)
+    _put_page(fname, len(fsm), page)
+    fsm.append(_free_space(*_read_footer_fast(page)))
+    return len(fsm) - 1, slot
+
+# Shared by the bulk insert paths: opens the file once and hands the tail
+# page, then fresh pages, to fill(page, page_num, locations), which copies in
+# as many records as fit, appends their (page, slot) to locations and returns
+# True once every record is placed. Each page it touched is written back.
+def _fill_tail_pages(fname: str, count: int, fill) -> List[Tuple[int,int]]:
+    if not os.path.exists(fname) or os.path.getsize(fname) == 0:
+        create_heap_file(fname)
+    locations: List[Tuple[int,int]] = []
+    if count == 0:
+        return locations
+    # this path writes through its own handle: push out and drop cached pages
+    _evict_file(fname)
+    with open(fname, "r+b") as f:
+        page_num = os.fstat(f.fileno()).st_size // PAGE_SIZE - 1
+        f.seek(page_num * PAGE_SIZE)
+        page = bytearray(PAGE_SIZE)
+        f.readinto(page)
+        while True:
+            done = fill(page, page_num, locations)
+            f.seek(page_num * PAGE_SIZE)
+            f.write(page)
+            _fsm_update(fname, page_num, page)
+            if done:
+                return locations
+            page_num += 1
+            page = bytearray(initialize_empty_page())
+
+def insert_records_bulk(fname: str, records: List[bytes]) -> List[Tuple[int,int]]:
+    pos = 0
+
+    def fill(page: bytearray, page_num: int, locations: List[Tuple[int,int]]) -> bool:
+        nonlocal pos
+        while pos < len(records):
+            try:
+                slot = insert_record_into_page(page, records[pos])
+            except ValueError:
+                if _read_footer_fast(page)[0] == 0:
+                    raise   # too big even for an empty page
+                return False
+            locations.append((page_num, slot))
+            pos += 1
+        return True
+
+    return _fill_tail_pages(fname, len(records), fill)
+
+def _insert_packed_records(fname: str, buf: bytes, record_size: int) -> List[Tuple[int,int]]:
+    # buf holds fixed-size records back to back: copy as many as fit into
+    # each page with one slice assignment instead of one insert per record
+    n = len(buf) // record_size
+    done = 0
+
+    def fill(page: bytearray, page_num: int, locations: List[Tuple[int,int]]) -> bool:
+        nonlocal done
+        slot_count, free_offset = _read_footer_fast(page)
+        k = min(n - done, _free_space(slot_count, free_offset) // (record_size + SLOT_ENTRY_SIZE))
+        if k:
+            end = free_offset + k * record_size
+            page[free_offset:end] = buf[done * record_size : (done + k) * record_size]
+            for j in range(k):
+                _write_slot(page, slot_count + j, free_offset + j * record_size, record_size)
+                locations.append((page_num, slot_count + j))
+            _write_footer(page, slot_count + k, end)
+            done += k
+        elif slot_count == 0:
+            raise ValueError("Not enough space in page")
+        return done == n
+
+    return _fill_tail_pages(fname, n, fill)
+
+def _mmap_file(fname: str) -> Tuple[mmap.mmap, int]:
+    # one read-only mapping of the whole heap file; stays valid after close
+    with open(fname, "rb") as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    return mm, len(mm) // PAGE_SIZE
+
+def get_all_raw_records(fname: str) -> List[Tuple[int,int,bytes]]:
+    if not os.path.exists(fname):
+        return []
+    _flush_file(fname)
+    if os.path.getsize(fname) == 0:
+        return []
+    results = []
+    mm, num_pages = _mmap_file(fname)
+    # records are copied out: callers keep them after the file is rewritten
+    # or truncated, so no view of the mapping may escape
+    try:
+        for p in range(num_pages):
+            base = p * PAGE_SIZE
+            slot_count, _ = _FOOTER.unpack_from(mm, base + PAGE_SIZE - FOOTER_SIZE)
+            for si in range(slot_count):
+                offset, length = _SLOT.unpack_from(mm, base + _slot_pos(si))
+                results.append((p, si, mm[base + offset : base + offset + length]))
+    finally:
+        mm.close()
+    return results
+
+# --------------------------------
+# Schema parsing & record encode/decode
+# --------------------------------
+def load_schema(path: str) -> Dict[str, Any]:
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    tables = {}
+    if isinstance(data, list):
+        for t in data:
+            tables[t["table_name"]] = t
+    elif isinstance(data, dict):
+        if "table_name" in data:
+            tables[data["table_name"]] = data
+        else:
+            tables = data
+    for t in tables.values():
+        _compile_layout(t)
+    return tables
+
+@lru_cache(maxsize=None)
+def _parse_type(ft: str) -> Tuple[str,Any]:
+    ft = ft.strip()
+    if ft.startswith("char(") and ft.endswith(")"):
+        return "char", int(ft[len("char("):-1])
+    if ft.startswith("varchar(") and ft.endswith(")"):
+        return "varchar", int(ft[len("varchar("):-1])
+    if ft == "int":
+        return "int", None
+    if ft == "float":
+        return "float", None
+    raise ValueError(f"Unknown field type: {ft}")
+
+# Compiled per-table record layout: one struct.Struct for the whole record
+# plus a parallel list of (name, base, param) for each field.
+_Layout = namedtuple("_Layout", ["struct", "fields"])
+
+def _compile_layout(table: Dict[str,Any]) -> _Layout:
+    layout = table.get("_layout")
+    if layout is not None:
+        return layout
+    fmt = [">"]
+    cols = []
+    for f in table["fields"]:
+        base, param = _parse_type(f["type"])
+        if base == "int":
+            fmt.append("i")
+        elif base == "float":
+            fmt.append("f")
+        elif base == "char":
+            fmt.append(f"{param}s")
+        elif base == "varchar":
+            fmt.append(f"{1 + param}s")
+        cols.append((sys.intern(f["name"]), base, param))
+    layout = _Layout(struct.Struct("".join(fmt)), cols)
+    table["_layout"] = layout
+    table["_encoder"], table["_decoder"] = _compile_codecs(layout)
+    return layout
+
+# Generate straight-line encode/decode functions for one layout, so a row is
+# converted without looping over fields or dispatching on their types:
+#   _enc(record_dict) -> record bytes
+#   _dec(unpacked_tuple) -> record dict
+def _compile_codecs(layout: _Layout) -> Tuple[Any, Any]:
+    enc_args = []
+    dec_items = []
+    for i, (name, base, param) in enumerate(layout.fields):
+        key = repr(name)
+        if base == "int":
+            enc_args.append(f"int(g({key}, 0))")
+            dec_items.append(f"{key}: t[{i}]")
+        elif base == "float":
+            enc_args.append(f"float(g({key}, 0))")
+            dec_items.append(f"{key}: t[{i}]")
+        elif base == "char":
+            enc_args.append(f"str(g({key}, '')).encode('utf-8')[:{param}].ljust({param}, b'\\x00')")
+            dec_items.append(f"{key}: t[{i}].rstrip(b'\\x00').decode('utf-8')")
+        else:
+            enc_args.append(f"_pack_varchar(str(g({key}, '')), {param})")
+            dec_items.append(f"{key}: t[{i}][1:1 + t[{i}][0]].decode('utf-8')")
+    src = (
+        "def _enc(d):\n"
+        "    g = d.get\n"
+        f"    return _pack({', '.join(enc_args)})\n"
+        "def _dec(t):\n"
+        f"    return {{{', '.join(dec_items)}}}\n"
+    )
+    ns = {"_pack": layout.struct.pack, "_pack_varchar": _pack_varchar}
+    exec(src, ns)
+    return ns["_enc"], ns["_dec"]
+
+def encode_record(record_dict: Dict[str,Any], table_name: str, schema: Dict[str,Any]) -> bytes:
+    """
+    Convert Python dict -> bytes according to schema table description.
+    Fields encoded in schema order.
+    """
+    if table_name not in schema:
+        raise ValueError("table not in schema")
+    table = schema[table_name]
+    _compile_layout(table)
+    return table["_encoder"](record_dict)
+
+def encode_records(record_dicts: List[Dict[str,Any]], table_name: str, schema: Dict[str,Any]) -> bytearray:
+    """
+    Encode many records into one contiguous buffer of
+    len(record_dicts) * record_size bytes, packed back to back.
+    """
+    if table_name not in schema:
+        raise ValueError("table not in schema")
+    table = schema[table_name]
+    _compile_layout(table)
+    return bytearray().join(map(table["_encoder"], record_dicts))
+
+def decode_record(record_bytes: bytes, table_name: str, schema: Dict[str,Any]) -> Dict[str,Any]:
+    """
+    Convert bytes -> Python dict according to schema table description.
+    """
+    if table_name not in schema:
+        raise ValueError("table not in schema")
+    table = schema[table_name]
+    layout = _compile_layout(table)
+    return table["_decoder"](layout.struct.unpack_from(record_bytes))
+
+# --------------------------------
+# Structured file operations (user-facing)
+# --------------------------------
+def table_file_name(table_desc: Dict[str,Any]) -> str:
+    return table_desc.get("file_name") or (table_desc["table_name"] + ".heap")
+
+def insert_structured_record(table_name: str, schema: Dict[str,Any], record_dict: Dict[str,Any]) -> Tuple[int,int]:
+    """
+    Encode record and insert into heap file for that table.
+    Returns (page_number, slot_index).
+    """
+    table = schema[table_name]
+    fname = table_file_name(table)
+    rec = encode_record(record_dict, table_name, schema)
+    if table.get("storage") != "columnar":
+        return insert_record(fname, rec)
+    synced = _sidecars_synced(table)
+    _append_columns(table, fname, rec, 1)
+    loc = insert_record(fname, rec)
+    if synced:
+        _mark_sidecars_synced(fname)
+    return loc
+
+def insert_structured_records(table_name: str, schema: Dict[str,Any], record_dicts: List[Dict[str,Any]]) -> List[Tuple[int,int]]:
+    """
+    Encode several records and insert them with one pass over the heap file.
+    Returns [(page_number, slot_index), ...] in input order.
+    """
+    table = schema[table_name]
+    fname = table_file_name(table)
+    buf = encode_records(record_dicts, table_name, schema)
+    size = _compile_layout(table).struct.size
+    if table.get("storage") != "columnar":
+        return _insert_packed_records(fname, buf, size)
+    synced = _sidecars_synced(table)
+    _append_columns(table, fname, buf, len(record_dicts))
+    locs = _insert_packed_records(fname, buf, size)
+    if synced:
+        _mark_sidecars_synced(fname)
+    return locs
+
+# --------------------------------
+# Columnar sidecar files
+# --------------------------------
+def column_file_name(table_desc: Dict[str,Any], field: str) -> str:
+    return os.path.splitext(table_file_name(table_desc))[0] + f".{field}.col"
+
+def _stamp_file_name(table_desc: Dict[str,Any]) -> str:
+    return os.path.splitext(table_file_name(table_desc))[0] + ".colstamp"
+
+# Sidecar freshness: {fname: (generation, stamp)} where generation is the
+# _HEAP_GEN value the sidecars last matched (-1: found stale) and stamp is
+# what the stamp file holds. The stamp names the heap file as it was on
+# disk when the sidecars matched it, so another process can trust them
+# while the heap file is unchanged.
+_SIDECAR_SYNC: Dict[str, Tuple[int, Optional[str]]] = {}
+
+def _heap_stamp(table: Dict[str,Any]) -> str:
+    fname = table_file_name(table)
+    _flush_file(fname)
+    try:
+        st = os.stat(fname)
+    except FileNotFoundError:
+        return ""
+    return f"{st.st_mtime_ns} {st.st_size} {_compile_layout(table).struct.format}"
+
+def _sidecars_synced(table: Dict[str,Any]) -> bool:
+    fname = table_file_name(table)
+    if not os.path.exists(fname):
+        return True   # _append_columns restarts the sidecars with the heap
+    sync = _SIDECAR_SYNC.get(fname)
+    if sync is None:
+        # first look in this process: compare the stamp left on disk
+        stamp = _heap_stamp(table)
+        try:
+            with open(_stamp_file_name(table)) as f:
+                saved = f.read()
+        except FileNotFoundError:
+            saved = None
+        sync = (_HEAP_GEN.get(fname, 0) if saved == stamp else -1, saved)
+        _SIDECAR_SYNC[fname] = sync
+    return sync[0] == _HEAP_GEN.get(fname, 0)
+
+def _mark_sidecars_synced(fname: str) -> None:
+    # the stamp file is refreshed by the next read_columns
+    sync = _SIDECAR_SYNC.get(fname)
+    _SIDECAR_SYNC[fname] = (_HEAP_GEN.get(fname, 0), sync[1] if sync else None)
+
+# encoded width of one field value (">" structs carry no padding)
+def _field_width(base: str, param: Optional[int]) -> int:
+    if base in ("int", "float"):
+        return 4
+    return param if base == "char" else 1 + param
+
+# split n encoded records into their fields and append each to its column
+# file; the sidecars restart whenever the heap file is about to be created
+def _append_columns(table: Dict[str,Any], fname: str, buf: bytes, n: int) -> None:
+    layout = _compile_layout(table)
+    size = layout.struct.size
+    mode = "ab" if os.path.exists(fname) else "wb"
+    mv = memoryview(buf)
+    off = 0
+    for name, base, param in layout.fields:
+        w = _field_width(base, param)
+        with open(column_file_name(table, name), mode) as f:
+            f.write(b"".join(mv[i:i + w] for i in range(off, n * size, size)))
+        off += w
+
+# records in the heap file: the sum of its page slot counts
+def _heap_record_count(fname: str) -> int:
+    if not os.path.exists(fname):
+        return 0
+    _flush_file(fname)
+    if os.path.getsize(fname) == 0:
+        return 0
+    mm, num_pages = _mmap_file(fname)
+    try:
+        return sum(_FOOTER.unpack_from(mm, (p + 1) * PAGE_SIZE - FOOTER_SIZE)[0] for p in range(num_pages))
+    finally:
+        mm.close()
+
+# rewrite every sidecar of the table from the heap file (empty when the
+# heap file is missing)
+def _rebuild_columns(table: Dict[str,Any]) -> None:
+    layout = _compile_layout(table)
+    rows = list(_iter_record_tuples(table))
+    columns = zip(*rows) if rows else [()] * len(layout.fields)
+    for (name, base, param), col in zip(layout.fields, columns):
+        if base in ("int", "float"):
+            data = struct.pack(f">{len(col)}{'i' if base == 'int' else 'f'}", *col)
+        else:
+            data = b"".join(col)
+        with open(column_file_name(table, name), "wb") as f:
+            f.write(data)
+
+def _read_column_file(table: Dict[str,Any], field: str, base: str, param: Optional[int]):
+    path = column_file_name(table, field)
+    data = b""
+    if os.path.exists(path):
+        with open(path, "rb") as f:
+            data = f.read()
+    if base in ("int", "float"):
+        col = array("i" if base == "int" else "f")
+        col.frombytes(data)
+        if sys.byteorder == "little":
+            col.byteswap()   # stored big-endian like the heap records
+        return col
+    w = _field_width(base, param)
+    if base == "char":
+        return [_unpack_char(v) for (v,) in struct.iter_unpack(f"{w}s", data)]
+    return [_unpack_varchar(v, param) for (v,) in struct.iter_unpack(f"{w}s", data)]
+
+def read_columns(table_name: str, schema: Dict[str,Any], fields: List[str]) -> Dict[str,Any]:
+    """
+    Read some fields of a columnar table from their sidecar files:
+    {field: column}, int/float as array.array('i'/'f'), char/varchar as
+    str lists. Sidecars that were not kept in step with the heap file
+    (heap written without going through the columnar insert paths, file
+    removed or replaced, table made columnar after it had rows) are
+    rebuilt from the heap first.
+    """
+    table = schema[table_name]
+    specs = {name: (base, param) for name, base, param in _compile_layout(table).fields}
+    for field in fields:
+        if field not in specs:
+            raise ValueError(f"Unknown field '{field}' in table '{table_name}'")
+    fname = table_file_name(table)
+    fresh = _sidecars_synced(table)
+    if fresh:
+        # cheap guard against files changed behind this process's back
+        count = _heap_record_count(fname)
+        for field in fields:
+            path = column_file_name(table, field)
+            size = os.path.getsize(path) if os.path.exists(path) else -1
+            if size != count * _field_width(*specs[field]):
+                fresh = False
+                break
+    if not fresh:
+        _rebuild_columns(table)
+    _mark_sidecars_synced(fname)
+    stamp = _heap_stamp(table)
+    if _SIDECAR_SYNC[fname][1] != stamp:
+        with open(_stamp_file_name(table), "w") as f:
+            f.write(stamp)
+        _SIDECAR_SYNC[fname] = (_SIDECAR_SYNC[fname][0], stamp)
+    return {field: _read_column_file(table, field, *specs[field]) for field in fields}
+
+def read_column(table_name: str, schema: Dict[str,Any], field: str):
+    """
+    Read one field of a columnar table from its sidecar file (see
+    read_columns).
+    """
+    return read_columns(table_name, schema, [field])[field]
+
+def _iter_record_tuples(table: Dict[str,Any]) -> Iterator[tuple]:
+    # Every table is fixed-width (varchar reserves its full n bytes), so a page
+    # whose records are packed from offset 0 is decoded with one iter_unpack
+    # over the record area; other pages fall back to the slot table. Tuples
+    # are produced one page at a time, so a scan never holds the whole table.
+    layout = _compile_layout(table)
+    fname = table_file_name(table)
+    if not os.path.exists(fname):
+        return
+    _flush_file(fname)
+    if os.path.getsize(fname) == 0:
+        return
+    rec_struct = layout.struct
+    mm, num_pages = _mmap_file(fname)
+    try:
+        for p in range(num_pages):
+            base = p * PAGE_SIZE
+            slot_count, free_offset = _FOOTER.unpack_from(mm, base + PAGE_SIZE - FOOTER_SIZE)
+            if free_offset == slot_count * rec_struct.size:
+                # copy of at most one page, so no view of mm outlives a yield
+                yield from rec_struct.iter_unpack(mm[base : base + free_offset])
+            else:
+                for si in range(slot_count):
+                    offset, _ = _SLOT.unpack_from(mm, base + _slot_pos(si))
+                    yield rec_struct.unpack_from(mm, base + offset)
+    finally:
+        mm.close()
+
+# keep the unpacked tuples whose `field` decodes to `value`; only that one
+# column is decoded, so rejected records never become dicts
+def _filter_tuples(layout: _Layout, rows: Iterator[tuple], field: str, value: Any) -> Iterator[tuple]:
+    for i, (name, base, param) in enumerate(layout.fields):
+        if name == field:
+            break
+    else:
+        return iter(())
+    # str never equals int/float: a value of the wrong kind skips the scan
+    if (base in ("char", "varchar")) != isinstance(value, str):
+        return iter(())
+    rows, keys = tee(rows)
+    col = map(itemgetter(i), keys)
+    if base == "char":
+        col = map(_unpack_char, col)
+    elif base == "varchar":
+        col = map(_unpack_varchar, col, repeat(param))
+    return compress(rows, map(eq, col, repeat(value)))
+
+def iter_structured_records(table_name: str, schema: Dict[str,Any], predicate: Optional[Tuple[str,Any]] = None) -> Iterator[Dict[str,Any]]:
+    """
+    Lazily decode the table's records, one page in memory at a time.
+    predicate=(field, value) keeps only records whose field equals value,
+    tested before the records are decoded.
+    """
+    table = schema[table_name]
+    layout = _compile_layout(table)
+    rows = _iter_record_tuples(table)
+    if predicate is not None:
+        rows = _filter_tuples(layout, rows, *predicate)
+    return map(table["_decoder"], rows)
+
+def read_all_structured_records(table_name: str, schema: Dict[str,Any], predicate: Optional[Tuple[str,Any]] = None) -> List[Dict[str,Any]]:
+    """
+    Read all raw records from table heap file and decode them.
+    predicate=(field, value) keeps only records whose field equals value,
+    tested before the records are decoded.
+    """
+    return list(iter_structured_records(table_name, schema, predicate))
+
+def read_all_columnar(table_name: str, schema: Dict[str,Any], copy: bool = True) -> Dict[str,Any]:
+    """
+    Read the whole table column-major: {field: column}. int/float columns
+    are contiguous array.array('i'/'f') values, char/varchar are str lists.
+    The decoded columns of small tables are cached until the heap file
+    changes; each call returns fresh copies of them, or with copy=False the
+    cached columns themselves, which the caller must not modify.
+    """
+    table = schema[table_name]
+    layout = _compile_layout(table)
+    fname = table_file_name(table)
+    if not os.path.exists(fname):
+        return _decode_columns(layout, [])
+    _flush_file(fname)
+    st = os.stat(fname)
+    key = (st.st_mtime_ns, st.st_size, layout)
+    cached = _COLUMN_CACHE.get(fname)
+    if cached is None or cached[:3] != key:
+        cached = key + (_decode_columns(layout, list(_iter_record_tuples(table))),)
+        _COLUMN_CACHE.pop(fname, None)
+        if st.st_size <= _COLUMN_CACHE_BYTES:
+            _COLUMN_CACHE[fname] = cached
+            while sum(c[1] for c in _COLUMN_CACHE.values()) > _COLUMN_CACHE_BYTES:
+                _COLUMN_CACHE.popitem(last=False)
+    else:
+        _COLUMN_CACHE.move_to_end(fname)
+    if not copy or fname not in _COLUMN_CACHE:
+        return dict(cached[3])
+    return {name: col[:] for name, col in cached[3].items()}
+
+def columnar_cached(table_name: str, schema: Dict[str,Any]) -> bool:
+    """
+    True when read_all_columnar would answer from its cache, without
+    scanning the heap file.
+    """
+    table = schema[table_name]
+    fname = table_file_name(table)
+    cached = _COLUMN_CACHE.get(fname)
+    if cached is None:
+        return False
+    try:
+        st = os.stat(fname)
+    except FileNotFoundError:
+        return False
+    return cached[:3] == (st.st_mtime_ns, st.st_size, _compile_layout(table))
+
+def _decode_columns(layout: _Layout, rows: List[tuple]) -> Dict[str,Any]:
+    # transpose unpacked record tuples into typed columns
+    columns = zip(*rows) if rows else [()] * len(layout.fields)
+    cols: Dict[str,Any] = {}
+    for (name, base, param), col in zip(layout.fields, columns):
+        if base == "int":
+            cols[name] = array("i", col)
+        elif base == "float":
+            cols[name] = array("f", col)
+        elif base == "char":
+            cols[name] = [_unpack_char(v) for v in col]
+        else:
+            cols[name] = [_unpack_varchar(v, param) for v in col]
+    return cols
@@ -1,71 +1,235 @@
 import re
+import sys
+from collections.abc import Mapping
+from functools import lru_cache
+
+from heap_core import (
+    columnar_cached, insert_structured_record, insert_structured_records,
+    iter_structured_records, read_all_columnar,
+)
+
+# -------------------------------------------
+# 0. Tokenizer
+# -------------------------------------------
+_END = ("end", "")
+# One token per match, skipping leading blanks. Groups: quoted literal
+# body, punctuation, bare word, or a lone quote (an unterminated literal).
+_TOKEN_RE = re.compile(r"\s*(?:'((?:[^']|'')*)'|([(),=*])|([^\s(),=*']+)|('))")
+# numeric literal; it is an int when none of the groups (fraction, leading
+# dot, exponent) took part in the match
+_NUM_RE = re.compile(r"[+-]?(?:\d+(\.\d*)?|(\.\d+))([eE][+-]?\d+)?")
+
+def _tokenize(q: str) -> list:
+    """
+    Split a query into (kind, text) tokens in one left-to-right pass:
+        "str"   - contents of a '...' literal (quotes removed,
+                  a doubled '' inside it stands for one quote)
+        "punct" - one of ( ) , = *
+        "word"  - any other run of non-blank characters
+                  (keywords, names, numbers)
+        "param" - a ? or :name placeholder (INSERT templates and
+                  prepared statements)
+    """
+    tokens = []
+    add = tokens.append
+    # the regex engine does the character scanning; Python only sees tokens
+    for text, punct, word, stray in _TOKEN_RE.findall(q):
+        if punct:
+            add(("punct", punct))
+        elif word:
+            if word == "?" or (word[0] == ":" and word[1:].isidentifier()):
+                add(("param", word))
+            else:
+                add(("word", word))
+        elif stray:
+            raise ValueError("Unterminated string literal")
+        else:
+            add(("str", text.replace("''", "'")))
+    return tokens
+
+def _tok(tokens: list, i: int) -> tuple:
+    return tokens[i] if i < len(tokens) else _END
+
+def _is_keyword(tok: tuple, kw: str) -> bool:
+    # case-insensitive; only a word of the keyword's length gets uppercased
+    return tok[0] == "word" and len(tok[1]) == len(kw) and (tok[1] == kw or tok[1].upper() == kw)
+
+def _is_name(tok: tuple) -> bool:
+    # same characters as the old \w+ patterns
+    return tok[0] == "word" and tok[1].replace("_", "a").isalnum()
+
+def _parse_names(tokens: list, i: int) -> tuple:
+    """
+    Read name (, name)* starting at tokens[i].
+    Returns (names, next_index), names is None if no name is found.
+    Names are interned so they are the same str objects as the schema's
+    field names and dict lookups on them compare by identity.
+    """
+    names = []
+    while True:
+        tok = _tok(tokens, i)
+        if not _is_name(tok):
+            return None, i
+        names.append(sys.intern(tok[1]))
+        i += 1
+        if _tok(tokens, i) != ("punct", ","):
+            return names, i
+        i += 1
+
+def _trim(query: str) -> str:
+    # blanks around the query plus any trailing ';'; the ';' pass only runs
+    # (and copies the string) when there is one
+    q = query.strip()
+    if q[-1:] == ";":
+        q = q.rstrip(";")
+    return q
+
+def _literal_value(tok: tuple):
+    # Quoted text stays a string, bare words become int/float when they are
+    # numeric; one regex match decides, with no exception on the string path
+    kind, value = tok
+    if kind == "str":
+        return value
+    m = _NUM_RE.fullmatch(value)
+    if m is None:
+        return value
+    return int(value) if m.lastindex is None else float(value)
 
 # -------------------------------------------
 # 1. Parse SELECT Query
 # -------------------------------------------
-def parse_select_query(query: str, schema: dict) -> dict:
+# Parsed plans are cached per raw query string. A plan does not depend on the
+# schema, so the table check stays in the public function and runs every
+# call; plans are tuples and each call builds a fresh dict from them.
+@lru_cache(maxsize=512)
+def _select_plan(query: str, params: bool = False) -> tuple:
     """
-    Parse:
-        SELECT fields FROM table WHERE field = value
-    Supports:
-        - SELECT *
-        - SELECT f1, f2, ...
-        - Optional WHERE
-    Returns:
-        {"fields": [...], "table": str, "condition": {"field":..., "value":...} or None}
+    Returns (fields, table, condition, placeholders) with fields a tuple
+    and condition None or a (field, value) pair. With params=True the
+    WHERE value may be ? or :name: value is then None and placeholders
+    is ((0, name or None),), otherwise placeholders is empty.
     """
 
-    q = query.strip().rstrip(";")
+    q = _trim(query)
+
+    # cheap reject before tokenizing the whole query
+    if q[:6].upper() != "SELECT":
+        raise ValueError("Invalid SELECT query")
+
+    tokens = _tokenize(q)
 
-    # Basic SELECT ... FROM ... (WHERE ...) pattern
-    pattern = r"SELECT\s+(?P<fields>[\*\w,\s]+)\s+FROM\s+(?P<table>\w+)(?:\s+WHERE\s+(?P<cond>.+))?$"
-    m = re.match(pattern, q, flags=re.IGNORECASE)
-    if not m:
+    if not _is_keyword(_tok(tokens, 0), "SELECT"):
         raise ValueError("Invalid SELECT query")
 
     # Fields
-    fields_raw = m.group("fields").strip()
-    if fields_raw == "*":
-        fields = ["*"]
+    if _tok(tokens, 1) == ("punct", "*"):
+        fields, i = ["*"], 2
     else:
-        fields = [f.strip() for f in fields_raw.split(",")]
+        fields, i = _parse_names(tokens, 1)
+    if fields is None or not _is_keyword(_tok(tokens, i), "FROM"):
+        raise ValueError("Invalid SELECT query")
 
     # Table
-    table = m.group("table")
-    if table not in schema:
-        raise ValueError(f"Unknown table '{table}'")
+    if not _is_name(_tok(tokens, i + 1)):
+        raise ValueError("Invalid SELECT query")
+    table = tokens[i + 1][1]
+    i += 2
+    if i < len(tokens) and not _is_keyword(tokens[i], "WHERE"):
+        raise ValueError("Invalid SELECT query")
 
-    # Condition
-    cond_raw = m.group("cond")
+    # Condition: only field = value
     condition = None
-    if cond_raw:
-        # Only handle: field = value
-        cond_m = re.match(r"(\w+)\s*=\s*(.+)", cond_raw.strip())
-        if not cond_m:
+    placeholders = ()
+    if i < len(tokens):
+        field, op, value = _tok(tokens, i + 1), _tok(tokens, i + 2), _tok(tokens, i + 3)
+        is_param = params and value[0] == "param"
+        if (not _is_name(field) or op != ("punct", "=")
+                or not (is_param or value[0] in ("str", "word")) or i + 4 != len(tokens)):
             raise ValueError("Invalid WHERE condition")
-        field, value = cond_m.group(1), cond_m.group(2)
-
-        # Remove quotes if present
-        if value.startswith("'") and value.endswith("'"):
-            value = value[1:-1]
+        if is_param:
+            condition = (sys.intern(field[1]), None)
+            placeholders = ((0, None if value[1] == "?" else value[1][1:]),)
         else:
-            # Try int or float
-            if value.isdigit():
-                value = int(value)
-            else:
-                try:
-                    value = float(value)
-                except:
-                    pass
+            condition = (sys.intern(field[1]), _literal_value(value))
 
-        condition = {"field": field, "value": value}
+    return tuple(fields), table, condition, placeholders
 
-    return {"fields": fields, "table": table, "condition": condition}
+def parse_select_query(query: str, schema: dict) -> dict:
+    """
+    Parse:
+        SELECT fields FROM table WHERE field = value
+    Supports:
+        - SELECT *
+        - SELECT f1, f2, ...
+        - Optional WHERE
+    Returns:
+        {"fields": [...], "table": str, "condition": {"field":..., "value":...} or None}
+    """
+
+    fields, table, condition, _ = _select_plan(query)
+    if table not in schema:
+        raise ValueError(f"Unknown table '{table}'")
+    if condition is not None:
+        condition = {"field": condition[0], "value": condition[1]}
+
+    return {"fields": list(fields), "table": table, "condition": condition}
 
 
 # -------------------------------------------
 # 2. Parse INSERT Query
 # -------------------------------------------
+@lru_cache(maxsize=512)
+def _insert_plan(query: str, params: bool = False) -> tuple:
+    """
+    Returns (table, fields, values, placeholders) with fields and values
+    as tuples. With params=True, ? and :name are accepted as values: each
+    one leaves None in values and adds (position, name or None) to
+    placeholders.
+    """
+
+    q = _trim(query)
+
+    # cheap reject before tokenizing the whole query
+    if q[:6].upper() != "INSERT":
+        raise ValueError("Invalid INSERT query")
+
+    tokens = _tokenize(q)
+
+    if (not _is_keyword(_tok(tokens, 0), "INSERT") or not _is_keyword(_tok(tokens, 1), "INTO")
+            or not _is_name(_tok(tokens, 2)) or _tok(tokens, 3) != ("punct", "(")):
+        raise ValueError("Invalid INSERT query")
+
+    table = tokens[2][1]
+
+    fields, i = _parse_names(tokens, 4)
+    if (fields is None or _tok(tokens, i) != ("punct", ")")
+            or not _is_keyword(_tok(tokens, i + 1), "VALUES") or _tok(tokens, i + 2) != ("punct", "(")):
+        raise ValueError("Invalid INSERT query")
+    i += 3
+
+    # Values: literal (, literal)* )
+    values = []
+    placeholders = []
+    while True:
+        tok = _tok(tokens, i)
+        if tok[0] == "param" and params:
+            placeholders.append((len(values), None if tok[1] == "?" else tok[1][1:]))
+            values.append(None)
+        elif tok[0] in ("str", "word"):
+            values.append(_literal_value(tok))
+        else:
+            raise ValueError("Invalid INSERT query")
+        i += 1
+        tok = _tok(tokens, i)
+        if tok == ("punct", ","):
+            i += 1
+        elif tok == ("punct", ")") and i + 1 == len(tokens):
+            break
+        else:
+            raise ValueError("Invalid INSERT query")
+
+    return table, tuple(fields), tuple(values), tuple(placeholders)
+
 def parse_insert_query(query: str, schema: dict) -> dict:
     """
     Parse:
@@ -74,60 +238,133 @@ def parse_insert_query(query: str, schema: dict) -> dict:
         {"table":..., "fields":[...], "values":[...]}
     """
 
-    q = query.strip().rstrip(";")
-
-    pattern = (
-        r"INSERT\s+INTO\s+(?P<table>\w+)\s*"
-        r"\((?P<fields>[\w,\s]+)\)\s*"
-        r"VALUES\s*\((?P<values>.+)\)$"
-    )
-
-    m = re.match(pattern, q, flags=re.IGNORECASE)
-    if not m:
-        raise ValueError("Invalid INSERT query")
+    table, fields, values, _ = _insert_plan(query)
 
-    table = m.group("table")
     if table not in schema:
         raise ValueError(f"Unknown table '{table}'")
 
-    fields = [f.strip() for f in m.group("fields").split(",")]
-    raw_values = [v.strip() for v in m.group("values").split(",")]
+    if len(fields) != len(values):
+        raise ValueError("Field count does not match value count")
 
-    values = []
-    for v in raw_values:
-        # Strip quotes
-        if v.startswith("'") and v.endswith("'"):
-            values.append(v[1:-1])
-        else:
-            # Try numeric
-            if v.isdigit():
-                values.append(int(v))
-            else:
-                try:
-                    values.append(float(v))
-                except:
-                    values.append(v)
+    return {"table": table, "fields": list(fields), "values": list(values)}
+
+def parse_insert_template(query: str, schema: dict) -> dict:
+    """
+    Parse an INSERT whose VALUES may hold placeholders:
+        INSERT INTO table (f1, f2,...) VALUES (?, 'fixed', ?)
+        INSERT INTO table (f1, f2,...) VALUES (:a, 'fixed', :b)
+    Returns:
+        {"table":..., "fields":[...], "values":[...], "params":[(position, name), ...]}
+    values holds the literal values (None at placeholder positions);
+    name is None for ? placeholders.
+    """
+
+    table, fields, values, placeholders = _insert_plan(query, True)
+
+    if table not in schema:
+        raise ValueError(f"Unknown table '{table}'")
 
     if len(fields) != len(values):
         raise ValueError("Field count does not match value count")
 
-    return {"table": table, "fields": fields, "values": values}
+    names = {name is None for _, name in placeholders}
+    if len(names) > 1:
+        raise ValueError("Cannot mix ? and :name placeholders")
+
+    return {"table": table, "fields": list(fields), "values": list(values), "params": list(placeholders)}
 
 
 # -------------------------------------------
 # 3. Execute Query
 # -------------------------------------------
+def _scan_eq(col, value) -> list:
+    """
+    Positions i with col[i] == value, in order. Each step is one C-level
+    index() search from the previous hit, so the loop runs once per match
+    rather than once per row.
+    """
+    hits = []
+    add = hits.append
+    find = col.index
+    i = -1
+    try:
+        while True:
+            i = find(value, i + 1)
+            add(i)
+    except ValueError:
+        return hits
+
+@lru_cache(maxsize=256)
+def _row_builder(names: tuple):
+    """
+    Generate, once per projected field list, a function taking one value
+    per field and returning the result row, e.g. for ("id", "name"):
+        def _row(v0, v1): return {'id': v0, 'name': v1}
+    map(_row, *columns) then builds every row with straight-line code.
+    """
+    args = ", ".join(f"v{i}" for i in range(len(names)))
+    items = ", ".join(f"{name!r}: v{i}" for i, name in enumerate(names))
+    ns = {}
+    exec(f"def _row({args}):\n    return {{{items}}}\n", ns)
+    return ns["_row"]
+
+def _query_kind(query: str) -> str:
+    # Only the leading keyword decides the dispatch: look at a short prefix
+    # instead of lowercasing a copy of the whole (possibly long) query
+    head = query[:16].lstrip()
+    if len(head) < 6:
+        head = query.lstrip()
+    return head[:6].lower()
+
+def _select_rows(table: str, fields: list, cond, schema: dict) -> list:
+    """
+    Run a parsed SELECT: fields is ["*"] or names, cond None or
+    {"field":..., "value":...}.
+    """
+
+    # Unknown projected names fail the same way whichever path runs below
+    if fields != ["*"]:
+        known = {f["name"] for f in schema[table]["fields"]}
+        for f in fields:
+            if f not in known:
+                raise ValueError(f"Unknown field '{f}' in table '{table}'")
+
+    # A filtered read of a table whose columns are not cached streams the
+    # heap page by page instead: the predicate is tested before decoding,
+    # so only the matching records are ever held
+    if cond and not columnar_cached(table, schema):
+        rows = iter_structured_records(table, schema, (cond["field"], cond["value"]))
+        if fields == ["*"]:
+            return list(rows)
+        build = _row_builder(tuple(fields))
+        return [build(*map(row.__getitem__, fields)) for row in rows]
+
+    # Read the table column by column (cached until the file changes); the
+    # shared columns are only read here, and only the needed ones are touched
+    cols = read_all_columnar(table, schema, copy=False)
+    names = list(cols) if fields == ["*"] else fields
+    picked = [cols[f] for f in names]
+
+    # Apply condition if exists: find the matching positions in the
+    # predicate column, then gather them from the projected columns
+    if cond:
+        hits = _scan_eq(cols.get(cond["field"], ()), cond["value"])
+        picked = [[col[i] for i in hits] for col in picked]
+
+    # Build result rows
+    return list(map(_row_builder(tuple(names)), *picked))
+
 def execute_query(query: str, schema: dict):
     """
     Executes SELECT or INSERT query directly on heap-file records.
     """
 
-    q_lower = query.lower().strip()
+    kind = _query_kind(query)
 
     # ---------------------
     # INSERT
     # ---------------------
-    if q_lower.startswith("insert"):
+    if kind == "insert":
         info = parse_insert_query(query, schema)
         table = info["table"]
         fields = info["fields"]
@@ -144,29 +381,103 @@ def execute_query(query: str, schema: dict):
     # ---------------------
     # SELECT
     # ---------------------
-    elif q_lower.startswith("select"):
+    elif kind == "select":
         info = parse_select_query(query, schema)
+        return _select_rows(info["table"], info["fields"], info["condition"], schema)
+
+    else:
+        raise ValueError("Query must start with SELECT or INSERT")
+
+
+# -------------------------------------------
+# 4. Execute a parameterized INSERT for many rows
+# -------------------------------------------
+def execute_many(query_template: str, rows, schema: dict):
+    """
+    Parse an INSERT template once, then insert one record per row.
+    Rows are sequences for ? placeholders and mappings for :name ones.
+    """
+
+    info = parse_insert_template(query_template, schema)
+    table = info["table"]
+    fields = info["fields"]
+    placeholders = info["params"]
+    targets = [fields[pos] for pos, _ in placeholders]
+    base = dict(zip(fields, info["values"]))
+
+    # rows are bound like prepared-statement calls: a mapping as keyword
+    # parameters, anything else as positional ones
+    records = []
+    for row in rows:
+        if isinstance(row, Mapping):
+            values = _bind_params(placeholders, (), row)
+        else:
+            values = _bind_params(placeholders, tuple(row), {})
+        record = dict(base)
+        record.update(zip(targets, values))
+        records.append(record)
+
+    insert_structured_records(table, schema, records)
+    return {"status": "OK", "message": f"{len(records)} records inserted"}
+
+
+# -------------------------------------------
+# 5. Prepared statements
+# -------------------------------------------
+def _bind_params(placeholders, args: tuple, kwargs: dict) -> list:
+    # values for the placeholders, in order: positional for ?, by name for :name
+    if placeholders and placeholders[0][1] is not None:
+        if args:
+            raise ValueError("Named placeholders take keyword parameters")
+        try:
+            return [kwargs[name] for _, name in placeholders]
+        except KeyError as e:
+            raise ValueError(f"Missing parameter '{e.args[0]}'") from None
+    if kwargs:
+        raise ValueError("? placeholders take positional parameters")
+    if len(args) != len(placeholders):
+        raise ValueError(f"Expected {len(placeholders)} parameters, got {len(args)}")
+    return list(args)
+
+def prepare(query: str, schema: dict):
+    """
+    Parse a SELECT or INSERT once and return run(*params) / run(**params)
+    that executes it with its ? / :name placeholders bound, e.g.
+        by_id = prepare("SELECT name FROM Employee WHERE id = ?", schema)
+        by_id(1); by_id(2)
+    SELECT placeholders may only stand for the WHERE value.
+    """
+
+    kind = _query_kind(query)
+
+    if kind == "insert":
+        info = parse_insert_template(query, schema)
         table = info["table"]
         fields = info["fields"]
-        cond = info["condition"]
+        base = dict(zip(fields, info["values"]))
+        placeholders = info["params"]
 
-        # Read all structured records
-        rows = read_all_structured_records(table, schema)
+        def run(*args, **kwargs):
+            record = dict(base)
+            for (pos, _), v in zip(placeholders, _bind_params(placeholders, args, kwargs)):
+                record[fields[pos]] = v
+            insert_structured_record(table, schema, record)
+            return {"status": "OK", "message": "Record inserted"}
 
-        # Apply condition if exists
-        if cond:
-            field = cond["field"]
-            value = cond["value"]
-            rows = [r for r in rows if r.get(field) == value]
+    elif kind == "select":
+        fields, table, condition, placeholders = _select_plan(query, True)
+        if table not in schema:
+            raise ValueError(f"Unknown table '{table}'")
+        fields = list(fields)
 
-        # Project fields
-        if fields == ["*"]:
-            return rows
-        else:
-            projected = []
-            for r in rows:
-                projected.append({f: r[f] for f in fields})
-            return projected
+        def run(*args, **kwargs):
+            bound = _bind_params(placeholders, args, kwargs)
+            cond = None
+            if condition is not None:
+                cond = {"field": condition[0], "value": bound[0] if placeholders else condition[1]}
+            return _select_rows(table, fields, cond, schema)
 
     else:
         raise ValueError("Query must start with SELECT or INSERT")
+
+    return run